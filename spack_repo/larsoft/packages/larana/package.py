@@ -8,9 +8,10 @@ from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larana(CMakePackage, FnalGithubPackage):
+class Larana(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larana"""
 
     repo = "LArSoft/larana"
@@ -40,6 +41,7 @@ class Larana(CMakePackage, FnalGithubPackage):
     version("develop", branch="develop", get_full_repo=True)
 
     cxxstd_variant("17", "20", default="17")
+    precompiled_headers_variant()
 
     depends_on("cetmodules", type="build")
 
@@ -72,9 +74,16 @@ class Larana(CMakePackage, FnalGithubPackage):
         depends_on("larevt")
         depends_on("postgresql")
 
+    def patch(self):
+        if self.spec.satisfies("+pch"):
+            self.patch_precompiled_headers()
+
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
     @sanitize_paths
     def setup_build_environment(self, env):
@@ -91,4 +100,4 @@ class Larana(CMakePackage, FnalGithubPackage):
         if name == "cxxflags" and self.spec.compiler.name == "gcc":
             flags.append("-Wno-error=deprecated-declarations")
             flags.append("-Wno-error=class-memaccess")
-        return (flags, None, None)
+        return super().flag_handler(name, flags)
@@ -8,9 +8,10 @@ from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larcore(CMakePackage, FnalGithubPackage):
+class Larcore(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larcore"""
 
     repo = "LArSoft/larcore"
@@ -44,7 +45,10 @@ class Larcore(CMakePackage, FnalGithubPackage):
 
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
     @sanitize_paths
     def setup_build_environment(self, env):
@@ -65,4 +69,4 @@ class Larcore(CMakePackage, FnalGithubPackage):
         if name == "cxxflags" and self.spec.compiler.name == "gcc":
             flags.append("-Wno-error=deprecated-declarations")
             flags.append("-Wno-error=class-memaccess")
-        return (flags, None, None)
+        return super().flag_handler(name, flags)
@@ -3,13 +3,16 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import os
+
 from spack import *
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larcoreobj(CMakePackage, FnalGithubPackage):
+class Larcoreobj(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larcoreobj"""
 
     repo = "LArSoft/larcoreobj"
@@ -38,9 +41,56 @@ class Larcoreobj(CMakePackage, FnalGithubPackage):
 
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
     def flag_handler(self, name, flags):
         if name == "cxxflags" and self.spec.compiler.name == "gcc":
             flags.append("-Wno-error=deprecated-declarations")
-        return (flags, None, None)
+        return super().flag_handler(name, flags)
+
+    @run_after("install", when="+ccache")
+    def cache_test_sources(self):
+        cache_extra_test_sources(self, ["."])
+
+    def test_ccache_rebuild(self):
+        """build larcoreobj twice through ccache in different directories and report the hit rate"""
+        if not self.spec.satisfies("+ccache"):
+            raise SkipTest("Package must be installed with +ccache")
+
+        stage = self.test_suite.stage
+        cmake = Executable(self.spec["cmake"].prefix.bin.cmake)
+        cmake.add_default_env("CCACHE_DIR", join_path(stage, "ccache"))
+        cmake.add_default_env("CCACHE_BASEDIR", stage)
+        cmake.add_default_env("CCACHE_NOHASHDIR", "true")
+        cxxflags, _, _ = self.flag_handler("cxxflags", list(self.spec.compiler_flags["cxxflags"]))
+        prefix_path = ";".join(dep.prefix for dep in self.spec.traverse(root=False))
+
+        # The second build runs from other source and build directories, as a
+        # rebuild in a differently-hashed stage would.
+        for build in ("first", "second"):
+            source = join_path(stage, build, "src")
+            binary = join_path(stage, build, "build")
+            stats_log = join_path(stage, build, "ccache-stats.log")
+            copy_tree(install_test_root(self), source)
+            cmake.add_default_env("CCACHE_STATSLOG", stats_log)
+            cmake(
+                "-S",
+                source,
+                "-B",
+                binary,
+                f"-DCMAKE_PREFIX_PATH={prefix_path}",
+                f"-DCMAKE_CXX_STANDARD={self.spec.variants['cxxstd'].value}",
+                f"-DCMAKE_CXX_COMPILER_LAUNCHER={self.spec['ccache'].prefix.bin.ccache}",
+                f"-DCMAKE_CXX_FLAGS={' '.join(cxxflags)}",
+                "-DBUILD_TESTING=OFF",
+            )
+            cmake("--build", binary, "--parallel", str(os.cpu_count()))
+            hits, misses = self.ccache_hits(stats_log)
+            print(f"{build} build: {hits} hits, {misses} misses")
+
+        assert hits + misses, "ccache recorded no cacheable compilations"
+        assert hits, "the second build got no ccache hits"
+        print(f"rebuild hit rate: {100 * hits / (hits + misses):.1f}%")
@@ -8,9 +8,10 @@ from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Lardataobj(CMakePackage, FnalGithubPackage):
+class Lardataobj(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Lardataobj"""
 
     repo = "LArSoft/lardataobj"
@@ -55,7 +56,10 @@ class Lardataobj(CMakePackage, FnalGithubPackage):
 
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
     @sanitize_paths
     def setup_build_environment(self, env):
@@ -7,9 +7,10 @@ from spack import *
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Lareventdisplay(CMakePackage, FnalGithubPackage):
+class Lareventdisplay(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Lareventdisplay"""
 
     repo = "LArSoft/lareventdisplay"
@@ -71,7 +72,10 @@ class Lareventdisplay(CMakePackage, FnalGithubPackage):
 
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
     @sanitize_paths
     def setup_run_environment(self, env):
@@ -82,4 +86,4 @@ class Lareventdisplay(CMakePackage, FnalGithubPackage):
         if name == "cxxflags" and self.spec.compiler.name == "gcc":
             flags.append("-Wno-error=deprecated-declarations")
             flags.append("-Wno-error=class-memaccess")
-        return (flags, None, None)
+        return super().flag_handler(name, flags)
@@ -8,9 +8,10 @@ from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larevt(CMakePackage, FnalGithubPackage):
+class Larevt(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larevt"""
 
     repo = "LArSoft/larevt"
@@ -34,6 +35,7 @@ class Larevt(CMakePackage, FnalGithubPackage):
     version("develop", branch="develop", get_full_repo=True)
 
     cxxstd_variant("17", "20", default="17")
+    precompiled_headers_variant()
 
     depends_on("c", type="build")
     depends_on("cxx", type="build")
@@ -57,11 +59,16 @@ class Larevt(CMakePackage, FnalGithubPackage):
     depends_on("root")
     depends_on("sqlite")
 
+    def patch(self):
+        if self.spec.satisfies("+pch"):
+            self.patch_precompiled_headers()
+
     @cmake_preset
     def cmake_args(self):
         return [
             self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
             self.define("IGNORE_ABSOLUTE_TRANSITIVE_DEPENDENCIES", True),
+            *self.larsoft_cmake_args(),
         ]
 
     @sanitize_paths
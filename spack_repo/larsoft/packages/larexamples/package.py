@@ -3,14 +3,60 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import json
+import os
+import statistics
+import subprocess
+
 from spack import *
 from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
+
+_STARTUP_SERVICES = """
+services: {
+  TFileService: { fileName: "startup_hist.root" }
+  RandomNumberGenerator: {}
+  TimeTracker: {}
+  MemoryTracker: {}
+}
+"""
+
+_STARTUP_CONFIGS = {
+    "empty": "",
+    "services": _STARTUP_SERVICES,
+    "geometry": """
+#include "geometry_lartpcdetector.fcl"
+services: { @table::lartpcdetector_geometry_services }
+""",
+    "analysis": """
+#include "geometry_lartpcdetector.fcl"
+services: {
+  @table::lartpcdetector_geometry_services
+  TFileService: { fileName: "startup_hist.root" }
+  scheduler: { SkipEvent: [ "ProductNotFound" ] }
+}
+physics: {
+  analyzers: {
+    ana: {
+      module_type: AnalysisExample
+      # Placeholder inputs: the empty events skip on ProductNotFound.
+      SimulationLabel: "largeant"
+      HitLabel: "gaushit"
+      ClusterLabel: "fuzzycluster"
+      PDGcode: 13
+      BinSize: 0.3
+    }
+  }
+  e1: [ ana ]
+}
+""",
+}
 
 
-class Larexamples(CMakePackage, FnalGithubPackage):
+class Larexamples(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larexamples"""
 
     repo = "LArSoft/larexamples"
@@ -75,7 +121,10 @@ class Larexamples(CMakePackage, FnalGithubPackage):
 
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
     @sanitize_paths
     def setup_build_environment(self, env):
@@ -88,3 +137,52 @@ class Larexamples(CMakePackage, FnalGithubPackage):
     def setup_run_environment(self, env):
         env.prepend_path("CET_PLUGIN_PATH", self.prefix.lib)
         env.prepend_path("FHICL_FILE_PATH", self.prefix.job)
+
+    @property
+    def startup_report(self):
+        return join_path(self.prefix, ".spack", "startup.json")
+
+    def _run_lar(self, config, events):
+        """Run lar on config and return its wall time and peak RSS in bytes."""
+        return self.measured_run(
+            [self.spec["art"].prefix.bin.lar, "-c", config, "-n", str(events)],
+            stdout=subprocess.DEVNULL,
+        )
+
+    def test_startup(self):
+        """measure lar startup time, time to first event and peak RSS on reference jobs"""
+        search_path = os.environ.get("FHICL_FILE_PATH", "").split(":")
+        have_geometry = any(
+            os.path.exists(join_path(d, "geometry_lartpcdetector.fcl")) for d in search_path
+        )
+        repeats = int(os.environ.get("LARSOFT_STARTUP_REPEATS", "5"))
+
+        report = {}
+        for name, body in _STARTUP_CONFIGS.items():
+            if "geometry_lartpcdetector.fcl" in body and not have_geometry:
+                print(f"{name}: skipped, geometry_lartpcdetector.fcl is not on FHICL_FILE_PATH")
+                continue
+            config = os.path.abspath(f"startup_{name}.fcl")
+            with open(config, "w") as f:
+                f.write(f"process_name: Startup\nsource: {{ module_type: EmptyEvent }}\n{body}")
+
+            startup = [self._run_lar(config, 0) for _ in range(repeats)]
+            first_event = [self._run_lar(config, 1) for _ in range(repeats)]
+            startup_seconds = statistics.median(t for t, _ in startup)
+            report[name] = {
+                "startup_seconds": startup_seconds,
+                # Time the one-event job spends beyond the zero-event one.
+                "first_event_seconds": statistics.median(t for t, _ in first_event)
+                - startup_seconds,
+                "peak_rss_bytes": max(rss for _, rss in startup + first_event),
+                "repeats": repeats,
+            }
+            result = report[name]
+            print(
+                f"{name}: startup {result['startup_seconds']:.2f} s, "
+                f"first event {result['first_event_seconds']:.2f} s, "
+                f"peak RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB"
+            )
+
+        with open(self.startup_report, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
@@ -8,9 +8,10 @@ from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larg4(CMakePackage, FnalGithubPackage):
+class Larg4(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larg4"""
 
     repo = "LArSoft/larg4"
@@ -37,6 +38,7 @@ class Larg4(CMakePackage, FnalGithubPackage):
     version("develop", branch="develop", get_full_repo=True)
 
     cxxstd_variant("17", "20", default="17")
+    precompiled_headers_variant()
 
     depends_on("c", type="build")
     depends_on("cxx", type="build")
@@ -65,15 +67,22 @@ class Larg4(CMakePackage, FnalGithubPackage):
     depends_on("range-v3")
     depends_on("root")
 
+    def patch(self):
+        if self.spec.satisfies("+pch"):
+            self.patch_precompiled_headers()
+
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
     def flag_handler(self, name, flags):
         if name == "cxxflags" and self.spec.compiler.name == "gcc":
             flags.append("-Wno-error=deprecated-declarations")
             flags.append("-Wno-error=class-memaccess")
-        return (flags, None, None)
+        return super().flag_handler(name, flags)
 
     @sanitize_paths
     def setup_build_environment(self, env):
@@ -8,9 +8,10 @@ from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larpandora(CMakePackage, FnalGithubPackage):
+class Larpandora(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larpandora"""
 
     repo = "LArSoft/larpandora"
@@ -50,6 +51,8 @@ class Larpandora(CMakePackage, FnalGithubPackage):
 
     cxxstd_variant("17", "20", default="17")
 
+    variant("torch", default=True, description="Register the LibTorch-based Pandora algorithms")
+
     depends_on("c", type="build")
     depends_on("cxx", type="build")
 
@@ -70,18 +73,32 @@ class Larpandora(CMakePackage, FnalGithubPackage):
     depends_on("lardata")
     depends_on("larevt")
     depends_on("larpandoracontent")
+    depends_on("larpandoracontent+torch", when="+torch")
     depends_on("larreco")
     depends_on("larsim")
     depends_on("messagefacility")
     depends_on("nusimdata")
     depends_on("pandorasdk")
-    depends_on("py-torch")
+    depends_on("py-torch", when="+torch")
     depends_on("root")
     depends_on("clhep")
     depends_on("cetmodules")
 
+    def patch(self):
+        if self.spec.satisfies("~torch"):
+            cmake_lists = find("larpandora", "CMakeLists.txt")
+            filter_file(r"^\s*find_package\(\s*Torch\b.*$", "", "CMakeLists.txt")
+            filter_file(
+                r"(larpandoracontent::LArPandoraDLContent|-DLIBTORCH_DL|LIBTORCH_DL)",
+                "",
+                *cmake_lists,
+                ignore_absent=True,
+            )
+
     @property
     def cmake_prefix_paths(self):
+        if self.spec.satisfies("~torch"):
+            return [self.prefix]
         return [self.prefix,
                 "{0}/lib/python{1}/site-packages/torch".format(
                 self.spec["py-torch"].prefix, self.spec["python"].version.up_to(2))
@@ -92,13 +109,14 @@ class Larpandora(CMakePackage, FnalGithubPackage):
         return [
             self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
             self.define("IGNORE_ABSOLUTE_TRANSITIVE_DEPENDENCIES", True),
+            *self.larsoft_cmake_args(),
         ]
 
     def flag_handler(self, name, flags):
         if name == "cxxflags" and self.spec.compiler.name == "gcc":
             flags.append("-Wno-error=deprecated-declarations")
             flags.append("-Wno-error=class-memaccess")
-        return (flags, None, None)
+        return super().flag_handler(name, flags)
 
     @sanitize_paths
     def setup_build_environment(self, env):
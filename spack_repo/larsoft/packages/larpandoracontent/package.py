@@ -7,9 +7,10 @@ from spack import *
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larpandoracontent(CMakePackage, FnalGithubPackage):
+class Larpandoracontent(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larpandoracontent"""
 
     repo = "LArSoft/larpandoracontent"
@@ -41,8 +42,10 @@ class Larpandoracontent(CMakePackage, FnalGithubPackage):
 
 
     cxxstd_variant("17", "20", default="17")
+    unity_build_variant()
 
     variant("monitoring", default=True, description="Enable PandoraMonitoring when building.")
+    variant("torch", default=True, description="Build the LibTorch-based larpandoradlcontent.")
 
     depends_on("c", type="build")
     depends_on("cxx", type="build")
@@ -53,7 +56,7 @@ class Larpandoracontent(CMakePackage, FnalGithubPackage):
     depends_on("pandoramonitoring", when="+monitoring")
     depends_on("pandorasdk")
     depends_on("pandorapfa")
-    depends_on("py-torch")
+    depends_on("py-torch", when="+torch")
 
     def patch(self):
         filter_file(r"set\(PANDORA_MONITORING TRUE\)", "", "CMakeLists.txt")
@@ -65,16 +68,29 @@ class Larpandoracontent(CMakePackage, FnalGithubPackage):
                 "larpandoracontent/CMakeLists.txt",
             )
 
+        if self.spec.satisfies("~torch"):
+            filter_file(r"^\s*find_package\(\s*Torch\b.*$", "", "CMakeLists.txt")
+            filter_file(
+                r"^\s*add_subdirectory\(\s*larpandoradlcontent\s*\).*$",
+                "",
+                "CMakeLists.txt",
+                ignore_absent=True,
+            )
+
     @cmake_preset
     def cmake_args(self):
         return [
             self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
             self.define("CMAKE_MODULE_PATH", f"{self.spec['pandorasdk'].prefix}/cmakemodules"),
             self.define_from_variant("PANDORA_MONITORING", "monitoring"),
+            self.define_from_variant("PANDORA_LIBTORCH", "torch"),
+            *self.larsoft_cmake_args(),
         ]
 
     @property
     def cmake_prefix_paths(self):
+        if self.spec.satisfies("~torch"):
+            return [self.prefix]
         return [self.prefix,
                 "{0}/lib/python{1}/site-packages/torch".format(
                     self.spec["py-torch"].prefix, self.spec["python"].version.up_to(2))
@@ -8,9 +8,10 @@ from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larreco(CMakePackage, FnalGithubPackage):
+class Larreco(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larreco"""
 
     repo = "LArSoft/larreco"
@@ -41,6 +42,8 @@ class Larreco(CMakePackage, FnalGithubPackage):
     version("develop", branch="develop", get_full_repo=True)
 
     cxxstd_variant("17", "20", default="17")
+    precompiled_headers_variant()
+    unity_build_variant()
 
     depends_on("c", type="build")
     depends_on("cxx", type="build")
@@ -76,12 +79,17 @@ class Larreco(CMakePackage, FnalGithubPackage):
 
     patch('09.25.00.patch', when='@09.25.00')
 
+    def patch(self):
+        if self.spec.satisfies("+pch"):
+            self.patch_precompiled_headers()
+
     @cmake_preset
     def cmake_args(self):
         return [
             self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
             self.define("IGNORE_ABSOLUTE_TRANSITIVE_DEPENDENCIES", True),
             self.define("RStarTree_INCLUDE_DIR", self.spec["rstartree"].prefix.include),
+            *self.larsoft_cmake_args(),
         ]
 
     @sanitize_paths
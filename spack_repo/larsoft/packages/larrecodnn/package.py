@@ -3,13 +3,23 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import os
+
 from spack import *
 from spack.package import *
-from spack_repo.builtin.build_systems.cmake import CMakePackage
+from spack_repo.builtin.build_systems.cmake import CMakePackage, generator
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
+
+# CMake packages and source directories built only with each inference backend.
+_BACKENDS = {
+    "torch": (("Torch",), ("Torch",)),
+    "triton": (("Triton\\w*", "gRPC"), ("NuSonic", "Triton")),
+    "nugraph": (("TorchScatter",), ("NuGraph",)),
+}
 
 
-class Larrecodnn(CMakePackage, FnalGithubPackage):
+class Larrecodnn(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larrecodnn"""
 
     repo = "LArSoft/larrecodnn"
@@ -40,11 +50,17 @@ class Larrecodnn(CMakePackage, FnalGithubPackage):
     version("develop", branch="develop", get_full_repo=True)
 
     cxxstd_variant("17", "20", default="17")
+    # Ninja records per-target build times, read by report_plugin_link_times.
+    generator("ninja", "make", default="ninja")
     variant(
         "tensorflow",
         default=True,
         description="Include py-tensorflow",
     )
+    variant("torch", default=True, description="Build the LibTorch inference modules")
+    variant("triton", default=True, description="Build the Triton inference-server clients")
+    variant("nugraph", default=True, description="Build NuGraph inference (needs +torch)")
+    conflicts("+nugraph", when="~torch", msg="NuGraph runs its models with LibTorch")
 
     depends_on("c", type="build")
     depends_on("cxx", type="build")
@@ -59,7 +75,7 @@ class Larrecodnn(CMakePackage, FnalGithubPackage):
     depends_on("cetlib-except")
     depends_on("clhep")
     depends_on("delaunator-cpp")
-    depends_on("grpc")
+    depends_on("grpc", when="+triton")
     depends_on("hdf5")
     depends_on("hep-hpc")
     depends_on("hep-hpc@0_15_00:", when="@10.03.05:")
@@ -76,19 +92,20 @@ class Larrecodnn(CMakePackage, FnalGithubPackage):
     depends_on("nusimdata")
     depends_on("protobuf", when="@:09.23.00")
     depends_on("py-tensorflow", when="+tensorflow")
-    depends_on("py-torch")
-    depends_on("torch-scatter")
+    depends_on("py-torch", when="+torch")
+    depends_on("torch-scatter", when="+nugraph")
     depends_on("root")
     depends_on("tbb")
-    depends_on("triton")
+    depends_on("triton", when="+triton")
     depends_on("zlib")
 
     def patch(self):
         filter_file("LANGUAGES CXX", "LANGUAGES CXX C", "CMakeLists.txt")
-        filter_file("find_package\(TensorFlow 2.6.0 QUIET EXPORT\)",
-                'list(APPEND CMAKE_FIND_LIBRARY_SUFFIXES ".so.2")\nfind_package(TensorFlow 2.6.0 REQUIRED EXPORT)',
-                "CMakeLists.txt"
-                )
+        if self.spec.satisfies("+tensorflow"):
+            filter_file("find_package\(TensorFlow 2.6.0 QUIET EXPORT\)",
+                    'list(APPEND CMAKE_FIND_LIBRARY_SUFFIXES ".so.2")\nfind_package(TensorFlow 2.6.0 REQUIRED EXPORT)',
+                    "CMakeLists.txt"
+                    )
         filter_file('#include "tensorflow/cc/saved_model/tag_constants.h"',
                     '#include "tensorflow/cc/saved_model/bundle_v2.h"\n#include "tensorflow/cc/saved_model/constants.h"\n#include "tensorflow/cc/saved_model/loader.h"',
                     "larrecodnn/ImagePatternAlgs/Tensorflow/TF/tf_graph.cc",
@@ -97,21 +114,23 @@ class Larrecodnn(CMakePackage, FnalGithubPackage):
                     "{},",
                     "larrecodnn/ImagePatternAlgs/Tensorflow/TF/tf_graph.cc",
                     )
-        #Take TorchScatter out of all link lists
-        filter_file("TorchScatter::TorchScatter",
-                    "#TorchScatter::TorchScatter",
-                    "larrecodnn/NuGraph/CMakeLists.txt",
-                    )
-        # but put it back for NuGraphInference
-        filter_file("IMPL_TARGET_VAR NuGraphInference_module",
-                    "TorchScatter::TorchScatter\nIMPL_TARGET_VAR NuGraphInference_module",
-                    "larrecodnn/NuGraph/CMakeLists.txt",
-                    )
+        if self.spec.satisfies("+nugraph"):
+            #Take TorchScatter out of all link lists
+            filter_file("TorchScatter::TorchScatter",
+                        "#TorchScatter::TorchScatter",
+                        "larrecodnn/NuGraph/CMakeLists.txt",
+                        )
+            # but put it back for NuGraphInference
+            filter_file("IMPL_TARGET_VAR NuGraphInference_module",
+                        "TorchScatter::TorchScatter\nIMPL_TARGET_VAR NuGraphInference_module",
+                        "larrecodnn/NuGraph/CMakeLists.txt",
+                        )
         # add extra warning skip for larrecodnn/ImageMaker
         filter_file("-Wno-stringop-overread",
                     "-Wno-stringop-overread;-Wno-stringop-overflow",
                     "larrecodnn/ImageMaker/CMakeLists.txt",
                    )
+        self.strip_cmake_components(_BACKENDS)
 
 
     @cmake_preset
@@ -122,79 +141,66 @@ class Larrecodnn(CMakePackage, FnalGithubPackage):
                 "DELAUNATOR_INC",
                 self.spec["delaunator-cpp"].prefix.include
             ),
+            *self.larsoft_cmake_args(),
         ]
         return args
 
+    @run_after("build")
+    def report_plugin_link_times(self):
+        """Log how long each library took to link (needs generator=ninja)."""
+        ninja_log = join_path(self.build_directory, ".ninja_log")
+        if not os.path.exists(ninja_log):
+            print("No .ninja_log to read link times from; build with generator=ninja")
+            return
+        link_times = {}
+        with open(ninja_log) as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                start, end, _, output, _ = line.rstrip("\n").split("\t")
+                if output.endswith(".so"):
+                    link_times[os.path.basename(output)] = (int(end) - int(start)) / 1000
+        for library, seconds in sorted(link_times.items(), key=lambda item: -item[1]):
+            print(f"{seconds:8.2f} s  {library}")
+        print(
+            f"Linked {len(link_times)} libraries in {sum(link_times.values()):.1f} s "
+            f"with linker={self.spec.variants['linker'].value}"
+        )
+
     @property
     def cmake_prefix_paths(self):
+        if self.spec.satisfies("~torch"):
+            return [self.prefix]
         return [self.prefix,
                 "{0}/lib/python{1}/site-packages/torch".format(
                 self.spec["py-torch"].prefix, self.spec["python"].version.up_to(2))
                 ]
 
     def setup_build_environment(self, env):
-        env.set("TRITON_DIR", self.spec["triton"].prefix.lib)
-
-    @when("+tensorflow")
-    def setup_build_environment(self, env):
-        env.set("TRITON_DIR", self.spec["triton"].prefix.lib)
-        env.set("TENSORFLOW_DIR",
-                join_path(
-                    self.spec["py-tensorflow"].prefix.lib,
-                    "python{0}/site-packages/tensorflow".format(
-                    self.spec["python"].version.up_to(2))) + ";" +
-                join_path(
-                    self.spec["py-tensorflow"].prefix.lib64,
-                    "python{0}/site-packages/tensorflow".format(
-                    self.spec["python"].version.up_to(2)))
-                )
-        env.set("TENSORFLOW_INC",
-                join_path(
-                    self.spec["py-tensorflow"].prefix.lib,
-                    "python{0}/site-packages/tensorflow/include".format(
-                    self.spec["python"].version.up_to(2))) + ";" +
-                join_path(
-                    self.spec["py-tensorflow"].prefix.lib64,
-                    "python{0}/site-packages/tensorflow/include".format(
-                    self.spec["python"].version.up_to(2)))
-                )
+        self._setup_backend_environment(env)
 
     @sanitize_paths
     def setup_run_environment(self, env):
         env.prepend_path("CET_PLUGIN_PATH", self.prefix.lib)
         env.prepend_path("FHICL_FILE_PATH", self.prefix.job)
         env.prepend_path("FW_SEARCH_PATH", self.prefix.config_data)
+        self._setup_backend_environment(env)
 
-    @when("+tensorflow")
-    def setup_run_environment(self, env):
-        env.prepend_path("CET_PLUGIN_PATH", self.prefix.lib)
-        env.prepend_path("FHICL_FILE_PATH", self.prefix.job)
-        env.prepend_path("FW_SEARCH_PATH", self.prefix.config_data)
-        env.set("TRITON_DIR", self.spec["triton"].prefix.lib)
-        env.set("TENSORFLOW_DIR",
-                join_path(
-                    self.spec["py-tensorflow"].prefix.lib,
-                    "python{0}/site-packages/tensorflow".format(
-                    self.spec["python"].version.up_to(2))) + ";" +
-                join_path(
-                    self.spec["py-tensorflow"].prefix.lib64,
-                    "python{0}/site-packages/tensorflow".format(
-                    self.spec["python"].version.up_to(2)))
-                )
-        env.set("TENSORFLOW_INC",
-                join_path(
-                    self.spec["py-tensorflow"].prefix.lib,
-                    "python{0}/site-packages/tensorflow/include".format(
-                    self.spec["python"].version.up_to(2))) + ";" +
-                join_path(
-                    self.spec["py-tensorflow"].prefix.lib64,
-                    "python{0}/site-packages/tensorflow/include".format(
-                    self.spec["python"].version.up_to(2)))
-                )
+    def _setup_backend_environment(self, env):
+        """Export the locations of the inference backends that are built."""
+        if self.spec.satisfies("+triton"):
+            env.set("TRITON_DIR", self.spec["triton"].prefix.lib)
+        if self.spec.satisfies("+tensorflow"):
+            self.setup_tensorflow_environment(env)
+
+    @run_after("install")
+    def install_tensorflow_hints(self):
+        if self.spec.satisfies("+tensorflow"):
+            self.write_tensorflow_hints()
 
     def flag_handler(self, name, flags):
         if name == "cxxflags" and self.spec.compiler.name == "gcc":
             flags.append("-Wno-error=deprecated-declarations")
             flags.append("-Wno-error=class-memaccess")
             flags.append("-Wno-error=ignored-attributes")
-        return (flags, None, None)
+        return super().flag_handler(name, flags)
@@ -8,9 +8,18 @@ from spack.package import *
 from spack.util.prefix import Prefix
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
+# CMake packages and source directories built only with each generator variant.
+_GENERATORS = {
+    "genie": (("GENIE", "dk2nugenie"), ("GENIE",)),
+    "marley": (("marley",), ("MARLEY",)),
+    "cry": (("CRY",), ("CRY",)),
+    "ppfx": (("ppfx",), ("PPFX",)),
+}
 
-class Larsim(CMakePackage, FnalGithubPackage):
+
+class Larsim(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larsim"""
 
     repo = "LArSoft/larsim"
@@ -40,6 +49,13 @@ class Larsim(CMakePackage, FnalGithubPackage):
     version("develop", branch="develop", get_full_repo=True)
 
     cxxstd_variant("17", "20", default="17")
+    precompiled_headers_variant()
+    unity_build_variant()
+
+    variant("genie", default=True, description="Build the GENIE neutrino generator interface")
+    variant("marley", default=True, description="Build the MARLEY supernova neutrino generator")
+    variant("cry", default=True, description="Build the CRY cosmic-ray generator")
+    variant("ppfx", default=True, description="Build the PPFX flux reweighting interface")
 
     depends_on("c", type="build")
     depends_on("cxx", type="build")
@@ -53,12 +69,12 @@ class Larsim(CMakePackage, FnalGithubPackage):
     depends_on("cetlib")
     depends_on("cetlib-except")
     depends_on("clhep")
-    depends_on("cry")
+    depends_on("cry", when="+cry")
     depends_on("dk2nudata")
-    depends_on("dk2nugenie")
+    depends_on("dk2nugenie", when="+genie")
     depends_on("fhicl-cpp")
     depends_on("geant4")
-    depends_on("genie")
+    depends_on("genie", when="+genie")
     depends_on("ifdhc")
     depends_on("larcorealg")
     depends_on("larcoreobj")
@@ -69,7 +85,7 @@ class Larsim(CMakePackage, FnalGithubPackage):
     depends_on("larevt")
     depends_on("larsoft-data")
     depends_on("log4cpp")
-    depends_on("marley")
+    depends_on("marley", when="+marley")
     depends_on("messagefacility")
     depends_on("nufinder")
     depends_on("nug4")
@@ -77,23 +93,29 @@ class Larsim(CMakePackage, FnalGithubPackage):
     depends_on("nurandom")
     depends_on("nusimdata")
     depends_on("nutools")
-    depends_on("ppfx")
+    depends_on("ppfx", when="+ppfx")
     depends_on("range-v3")
     depends_on("root")
     depends_on("sqlite")
 
+    def patch(self):
+        if self.spec.satisfies("+pch"):
+            self.patch_precompiled_headers()
+        self.strip_cmake_components(_GENERATORS)
+
     @cmake_preset
     def cmake_args(self):
         return [
             self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
             self.define("IGNORE_ABSOLUTE_TRANSITIVE_DEPENDENCIES", True),
+            *self.larsoft_cmake_args(),
         ]
 
     def flag_handler(self, name, flags):
         if name == "cxxflags" and self.spec.compiler.name == "gcc":
             flags.append("-Wno-error=deprecated-declarations")
             flags.append("-Wno-error=class-memaccess")
-        return (flags, None, None)
+        return super().flag_handler(name, flags)
 
     @sanitize_paths
     def setup_build_environment(self, env):
@@ -9,9 +9,10 @@ from spack import *
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larsimdnn(CMakePackage, FnalGithubPackage):
+class Larsimdnn(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larsim"""
 
     repo = "LArSoft/larsimdnn"
@@ -76,25 +77,19 @@ class Larsimdnn(CMakePackage, FnalGithubPackage):
 
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
-    @when("+tensorflow")
     def setup_build_environment(self, env):
-        env.set("TENSORFLOW_DIR",
-                join_path(self.spec["py-tensorflow"].prefix.lib,
-                "python%s/site-packages/tensorflow" % self.spec["python"].version.up_to(2),)
-                + ";" +
-                join_path(self.spec["py-tensorflow"].prefix.lib64,
-                "python%s/site-packages/tensorflow" % self.spec["python"].version.up_to(2),)
-        )
-        env.set(
-            "TENSORFLOW_INC",
-            join_path(self.spec["py-tensorflow"].prefix.lib,
-                "python%s/site-packages/tensorflow/include" % self.spec["python"].version.up_to(2),)
-            + ";" +
-            join_path(self.spec["py-tensorflow"].prefix.lib64,
-                "python%s/site-packages/tensorflow/include" % self.spec["python"].version.up_to(2),)
-        )
+        if self.spec.satisfies("+tensorflow"):
+            self.setup_tensorflow_environment(env)
+
+    @run_after("install")
+    def install_tensorflow_hints(self):
+        if self.spec.satisfies("+tensorflow"):
+            self.write_tensorflow_hints()
 
     @sanitize_paths
     def setup_run_environment(self, env):
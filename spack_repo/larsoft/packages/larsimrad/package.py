@@ -7,9 +7,10 @@ from spack import *
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
 
-class Larsimrad(CMakePackage, FnalGithubPackage):
+class Larsimrad(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """larsimrad"""
 
     repo = "LArSoft/larsimrad"
@@ -64,7 +65,10 @@ class Larsimrad(CMakePackage, FnalGithubPackage):
 
     @cmake_preset
     def cmake_args(self):
-        return [self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd")]
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
 
     @sanitize_paths
     def setup_run_environment(self, env):
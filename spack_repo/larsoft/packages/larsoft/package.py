@@ -3,14 +3,134 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import glob
+import json
 import os
+import re
+import shlex
+import sys
+import time
 
+import spack.user_environment as uenv
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
 
+# Compiled components that share the LarsoftPackage build options.
+_BUILD_COMPONENTS = (
+    "larana",
+    "larcore",
+    "larcorealg",
+    "larcoreobj",
+    "lardata",
+    "lardataalg",
+    "lardataobj",
+    "lareventdisplay",
+    "larevt",
+    "larexamples",
+    "larg4",
+    "larpandora",
+    "larpandoracontent",
+    "larreco",
+    "larrecodnn",
+    "larsim",
+    "larsimdnn",
+    "larsimrad",
+    "larvecutils",
+    "larwirecell",
+)
 
-class Larsoft(CMakePackage, FnalGithubPackage):
+# Allocator choices: providing package, library to preload and tuning for
+# long-running jobs that return freed memory to the system.
+_ALLOCATORS = {
+    "jemalloc": (
+        "jemalloc",
+        "libjemalloc",
+        {"MALLOC_CONF": "background_thread:true,dirty_decay_ms:1000,muzzy_decay_ms:1000"},
+    ),
+    "tcmalloc": ("gperftools", "libtcmalloc_minimal", {"TCMALLOC_AGGRESSIVE_DECOMMIT": "true"}),
+}
+
+# Many small allocations with random frees, run with PYTHONMALLOC=malloc so
+# they go through the preloaded allocator.
+_ALLOCATION_STRESS = """
+import random
+random.seed(42)
+live = []
+for i in range(3000000):
+    live.append(bytes(random.randint(16, 1024)))
+    if len(live) > 300000:
+        j = random.randrange(len(live))
+        live[j] = live[-1]
+        live.pop()
+"""
+
+# Fixed CNN inference workload used to compare thread settings.
+_INFERENCE_WORKLOAD = """
+import time, torch
+
+torch.manual_seed(0)
+model = torch.nn.Sequential(
+    torch.nn.Conv2d(1, 16, 3, padding=1), torch.nn.ReLU(),
+    torch.nn.Conv2d(16, 32, 3, padding=1), torch.nn.ReLU(),
+    torch.nn.AdaptiveAvgPool2d(8), torch.nn.Flatten(),
+    torch.nn.Linear(32 * 64, 128), torch.nn.ReLU(), torch.nn.Linear(128, 5),
+).eval()
+patches = torch.rand(16, 1, 128, 128)
+with torch.inference_mode():
+    model(patches)
+    start = time.perf_counter()
+    for _ in range(20):
+        model(patches)
+print(20 * len(patches) / (time.perf_counter() - start))
+"""
+
+
+def _thread_settings(threads):
+    """Environment limiting the OpenMP, MKL, TensorFlow and torch pools to threads."""
+    return {
+        "OMP_NUM_THREADS": str(threads),
+        "MKL_NUM_THREADS": str(threads),
+        "TF_NUM_INTRAOP_THREADS": str(threads),
+        "TF_NUM_INTEROP_THREADS": "1",
+    }
+
+
+# Bundle conditions under which optional components are part of the stack.
+_OPTIONAL_COMPONENTS = {"lareventdisplay": "+eventdisplay", "larexamples": "~grid"}
+
+# Packages that must stay out of the +grid closure.
+_GRID_EXCLUDED = ("lareventdisplay", "larexamples", "pandoramonitoring")
+
+# Search paths that the search_view variant flattens, and their view directories.
+_SEARCH_VIEWS = {"FHICL_FILE_PATH": "fcl_view", "FW_SEARCH_PATH": "fw_view"}
+
+# Stand-in for a variable's pre-existing value while resolving the run environment.
+_INHERITED = "@@{0}@@"
+
+# Library suffixes cetlib's LibraryManager looks up on CET_PLUGIN_PATH.
+_PLUGIN_LIBRARY = re.compile(
+    r"^lib(?P<spec>.+)_(?P<suffix>module|service|tool|source|plugin|dict|map"
+    r"|mfPlugin|mfStatsPlugin)\.so$"
+)
+
+
+def _csh_quote(value):
+    """Quote a value for csh, which has no escapes inside single quotes."""
+    return "'" + value.replace("'", "'\"'\"'").replace("!", "\\!") + "'"
+
+
+def _propagate_variant(name, components=_BUILD_COMPONENTS, values=None):
+    """Build components with the bundle's setting of a variant (boolean unless values are given)."""
+    settings = [f"{name}={value}" for value in values] if values else [f"+{name}", f"~{name}"]
+    for component in components:
+        condition = _OPTIONAL_COMPONENTS.get(component, "")
+        for setting in settings:
+            depends_on(f"{component} {setting}", when=f"{setting} {condition}".strip())
+
+
+class Larsoft(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Software for Liquid Argon time projection chambers"""
 
     repo = "LArSoft/larsoft"
@@ -51,6 +171,7 @@ class Larsoft(CMakePackage, FnalGithubPackage):
     version("develop", branch="develop", get_full_repo=True)
 
     cxxstd_variant("17", "20", default="17")
+    precompiled_headers_variant()
     variant(
         "eventdisplay",
         default=True,
@@ -63,21 +184,73 @@ class Larsoft(CMakePackage, FnalGithubPackage):
         description="Include larrecodnn and larsimdnn that depend on tensorflow",
     )
 
+    variant(
+        "torch",
+        default=True,
+        description="Build the LibTorch-based algorithms in larpandora, larpandoracontent and larrecodnn",
+    )
+
+    variant(
+        "grid",
+        default=False,
+        description="Minimal headless runtime for batch workers: no X/OpenGL, monitoring or examples",
+    )
+    conflicts("+eventdisplay", when="+grid", msg="+grid is headless; use ~eventdisplay")
+
+    variant(
+        "allocator",
+        default="system",
+        values=("system", "jemalloc", "tcmalloc"),
+        multi=False,
+        description="Memory allocator preloaded in the run environment",
+    )
+
+    variant(
+        "threads",
+        default="none",
+        values=lambda value: value == "none" or (value.isdigit() and int(value) > 0),
+        description="Threads per job for the OpenMP, MKL, TensorFlow and torch pools (none: unset)",
+    )
+
+    variant(
+        "plugin_view",
+        default=False,
+        description="Collect all art plugins into a single CET_PLUGIN_PATH directory at install",
+    )
+
+    variant(
+        "search_view",
+        default=False,
+        description="Merge FHICL_FILE_PATH and FW_SEARCH_PATH into single indexed trees at install",
+    )
+
     depends_on("c", type="build")
     depends_on("cxx", type="build")
 
     depends_on("cetmodules", type="build")
 
+    depends_on("jemalloc", type="run", when="allocator=jemalloc")
+    depends_on("gperftools", type="run", when="allocator=tcmalloc")
+
     depends_on("larfinder")
     depends_on("larg4")
     depends_on("larsoft-data")
     depends_on("larana")
-    depends_on("larexamples")
+    depends_on("larexamples", when="~grid")
     depends_on("larpandora")
     depends_on("larreco")
     depends_on("larsimrad")
     depends_on("larwirecell")
 
+    _propagate_variant("ipo")
+    _propagate_variant("prof")
+    _propagate_variant("ccache")
+    _propagate_variant("as_needed")
+    _propagate_variant("visibility")
+    _propagate_variant("bsymbolic_functions")
+    _propagate_variant("linker", values=("bfd", "gold", "lld", "mold"))
+    _propagate_variant("pch", ("larana", "lardata", "larevt", "larg4", "larreco", "larsim"))
+
     with when("+eventdisplay"):
         depends_on("lareventdisplay")
         depends_on("larpandoracontent +monitoring")
@@ -85,6 +258,10 @@ class Larsoft(CMakePackage, FnalGithubPackage):
     with when("~eventdisplay"):
         depends_on("larpandoracontent ~monitoring")
 
+    with when("+grid"):
+        depends_on("root~x~opengl")
+        depends_on("geant4~opengl~x11~qt~motif")
+
     with when("+tensorflow"):
         depends_on("larrecodnn+tensorflow")
         depends_on("larsimdnn+tensorflow")
@@ -93,6 +270,16 @@ class Larsoft(CMakePackage, FnalGithubPackage):
         depends_on("larrecodnn~tensorflow")
         depends_on("larsimdnn~tensorflow")
 
+    with when("+torch"):
+        depends_on("larpandora+torch")
+        depends_on("larpandoracontent+torch")
+        depends_on("larrecodnn+torch")
+
+    with when("~torch"):
+        depends_on("larpandora~torch")
+        depends_on("larpandoracontent~torch")
+        depends_on("larrecodnn~torch~nugraph")
+
     def patch(self):
         with when("@:09.90.01.01 ~eventdisplay"):
             filter_file(r"find_package\( *lareventdisplay.*", "", "CMakeLists.txt")
@@ -101,9 +288,386 @@ class Larsoft(CMakePackage, FnalGithubPackage):
             filter_file(r"find_package\( *larrecodnn.*", "", "CMakeLists.txt")
             filter_file(r"find_package\( *larsimdnn.*", "", "CMakeLists.txt")
 
+        if self.spec.satisfies("+grid"):
+            filter_file(r"find_package\( *larexamples.*", "", "CMakeLists.txt")
+
+    @cmake_preset
+    def cmake_args(self):
+        return [
+            self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
+            *self.larsoft_cmake_args(),
+        ]
+
     @run_after("install")
     def rename_bin_python(self):
         os.rename(
             join_path(self.spec.prefix, "bin/python"),
             join_path(self.spec.prefix, "bin/python-scripts"),
         )
+
+    @property
+    def plugin_manifest(self):
+        return join_path(self.prefix.share.larsoft, "plugins.json")
+
+    def _dependency_environment(self):
+        """Run environment of the bundle's dependencies, resolved into a dict."""
+        env = {}
+        uenv.environment_modifications_for_specs(
+            *self.spec.dependencies(deptype=("link", "run"))
+        ).apply_modifications(env)
+        return env
+
+    @staticmethod
+    def _search_path(env, name):
+        """Existing, deduplicated entries of a path variable, in lookup order."""
+        entries = []
+        for entry in env.get(name, "").split(os.pathsep):
+            if entry and os.path.isdir(entry) and entry not in entries:
+                entries.append(entry)
+        return entries
+
+    @run_after("install")
+    def make_plugin_view(self):
+        if not self.spec.satisfies("+plugin_view"):
+            return
+
+        search_path = self._search_path(self._dependency_environment(), "CET_PLUGIN_PATH")
+        mkdirp(self.prefix.plugins)
+        plugins = {}
+        conflicts = []
+        for directory in search_path:
+            for filename in sorted(os.listdir(directory)):
+                match = _PLUGIN_LIBRARY.match(filename)
+                if not match:
+                    continue
+                library = join_path(directory, filename)
+                link = join_path(self.prefix.plugins, filename)
+                if os.path.lexists(link):
+                    # First match on CET_PLUGIN_PATH wins, as in cetlib.
+                    conflicts.append({"used": os.readlink(link), "shadowed": library})
+                    continue
+                os.symlink(library, link)
+                # ROOT looks for a dictionary's PCM and rootmap next to the
+                # path the library was loaded from, i.e. the view.
+                stem = filename[: -len(".so")]
+                for companion in (f"{stem}_rdict.pcm", f"{stem}.rootmap"):
+                    if os.path.exists(join_path(directory, companion)):
+                        os.symlink(
+                            join_path(directory, companion),
+                            join_path(self.prefix.plugins, companion),
+                        )
+                short_spec = match.group("spec").rsplit("_", 1)[-1]
+                plugins.setdefault(match.group("suffix"), {}).setdefault(short_spec, library)
+
+        mkdirp(self.prefix.share.larsoft)
+        with open(self.plugin_manifest, "w") as f:
+            json.dump(
+                {"search_path": search_path, "plugins": plugins, "conflicts": conflicts},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        if conflicts:
+            tty.warn(f"{len(conflicts)} plugin libraries shadowed on CET_PLUGIN_PATH")
+
+    def search_index(self, name):
+        return join_path(self.prefix.share.larsoft, f"{name.lower()}.json")
+
+    @run_after("install")
+    def make_search_views(self):
+        if not self.spec.satisfies("+search_view"):
+            return
+
+        env = self._dependency_environment()
+        mkdirp(self.prefix.share.larsoft)
+        for name, view in _SEARCH_VIEWS.items():
+            search_path = self._search_path(env, name)
+            view = join_path(self.prefix, view)
+            files = {}
+            conflicts = []
+            for directory in search_path:
+                for root, _, filenames in os.walk(directory, followlinks=True):
+                    for filename in filenames:
+                        source = join_path(root, filename)
+                        relative = os.path.relpath(source, directory)
+                        if relative in files:
+                            # Earlier entries shadow later ones, as in a path walk.
+                            if os.path.realpath(files[relative]) != os.path.realpath(source):
+                                conflicts.append(
+                                    {"path": relative, "used": files[relative], "shadowed": source}
+                                )
+                            continue
+                        files[relative] = source
+                        link = join_path(view, relative)
+                        mkdirp(os.path.dirname(link))
+                        os.symlink(source, link)
+
+            with open(self.search_index(name), "w") as f:
+                json.dump(
+                    {"search_path": search_path, "files": files, "conflicts": conflicts},
+                    f,
+                    indent=2,
+                    sort_keys=True,
+                )
+            if conflicts:
+                tty.warn(f"{len(conflicts)} files shadowed on {name}, see {self.search_index(name)}")
+
+    def activation_script(self, shell):
+        return join_path(self.prefix.etc, f"larsoft-env.{shell}")
+
+    @staticmethod
+    def _activation_lines(name, value, shell, separator=os.pathsep):
+        """Shell code giving ``name`` its resolved value.
+
+        ``value`` holds the ``_INHERITED`` placeholder, as one of its
+        ``separator``-joined entries, where the variable's value at
+        activation time must be spliced in.
+        """
+        quote = _csh_quote if shell == "csh" else shlex.quote
+        inherited = _INHERITED.format(name)
+        entries = value.split(separator)
+        if inherited not in entries:
+            if shell == "csh":
+                return [f"setenv {name} {quote(value)}"]
+            return [f"export {name}={quote(value)}"]
+
+        if separator.strip():
+            # Search paths: the first occurrence of a directory wins.
+            entries = [entry for i, entry in enumerate(entries) if entry not in entries[:i]]
+        i = entries.index(inherited)
+        before = separator.join(entries[:i])
+        after = separator.join(entries[i + 1 :])
+        if not before and not after:
+            return []
+        if shell == "csh":
+            joined = "".join(
+                [
+                    quote(before + separator) if before else "",
+                    f'"${{{name}}}"',
+                    quote(separator + after) if after else "",
+                ]
+            )
+            unset = quote(separator.join(filter(None, [before, after])))
+            return [
+                f"if ( $?{name} ) then",
+                f"    setenv {name} {joined}",
+                "else",
+                f"    setenv {name} {unset}",
+                "endif",
+            ]
+        if before and after:
+            joined = f'{quote(before)}"${{{name}:+{separator}${name}}}"{quote(separator + after)}'
+        elif before:
+            joined = f'{quote(before)}"${{{name}:+{separator}${name}}}"'
+        else:
+            joined = f'"${{{name}:+${name}{separator}}}"{quote(after)}'
+        return [f"export {name}={joined}"]
+
+    @run_after("install")
+    def write_activation_scripts(self):
+        modifications = uenv.environment_modifications_for_specs(self.spec)
+        names = sorted({modification.name for modification in modifications})
+        separators = {}
+        for modification in modifications:
+            if getattr(modification, "separator", None):
+                separators[modification.name] = modification.separator
+        env = {name: _INHERITED.format(name) for name in names}
+        modifications.apply_modifications(env)
+
+        mkdirp(self.prefix.etc)
+        for shell in ("sh", "csh"):
+            lines = [f"# Run environment of {self.spec.short_spec}, resolved at install."]
+            for name in names:
+                if name not in env:
+                    lines.append(f"unsetenv {name}" if shell == "csh" else f"unset {name}")
+                else:
+                    separator = separators.get(name, os.pathsep)
+                    lines.extend(self._activation_lines(name, env[name], shell, separator))
+            with open(self.activation_script(shell), "w") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def allocator_library(self):
+        provider, library, _ = _ALLOCATORS[self.spec.variants["allocator"].value]
+        return find_libraries(library, root=self.spec[provider].prefix, recursive=True)[0]
+
+    def setup_run_environment(self, env):
+        allocator = self.spec.variants["allocator"].value
+        if allocator != "system":
+            env.prepend_path("LD_PRELOAD", self.allocator_library())
+            for name, value in _ALLOCATORS[allocator][2].items():
+                env.set(name, value)
+        threads = self.spec.variants["threads"].value
+        if threads != "none":
+            for name, value in _thread_settings(threads).items():
+                env.set(name, value)
+        if self.spec.satisfies("+plugin_view"):
+            self._use_view(env, "CET_PLUGIN_PATH", self.plugin_manifest, self.prefix.plugins)
+        if self.spec.satisfies("+search_view"):
+            for name, view in _SEARCH_VIEWS.items():
+                self._use_view(env, name, self.search_index(name), join_path(self.prefix, view))
+
+    @staticmethod
+    def _use_view(env, name, index, view):
+        """Put a view in front of a search path in place of the directories it merges.
+
+        Entries that are not from the bundle's dependencies, such as a local
+        development area, are kept.
+        """
+        if os.path.exists(index):
+            with open(index) as f:
+                for directory in json.load(f)["search_path"]:
+                    env.remove_path(name, directory)
+        env.prepend_path(name, view)
+
+    def _count_lookup_calls(self, cet_plugin_path):
+        """Count file-system calls made resolving every plugin on a search path.
+
+        Runs ``lar --print-available module`` under ``strace -c``.
+        """
+        strace = which("strace")
+        lar = which("lar")
+        if not (strace and lar):
+            raise SkipTest("strace and lar are needed to count plugin lookup calls")
+
+        log = join_path(self.test_suite.stage, "strace-plugins.txt")
+        strace(
+            "-f", "-c", "-o", log, "-e", "trace=%file",
+            lar.path, "--print-available", "module",
+            output=str, error=str,
+            extra_env={"CET_PLUGIN_PATH": cet_plugin_path},
+        )
+        calls = 0
+        with open(log) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 5 and fields[-1] != "total" and fields[3].isdigit():
+                    calls += int(fields[3])
+        return calls
+
+    def test_plugin_lookup(self):
+        """compare file-system calls for plugin lookup with and without the view"""
+        if not self.spec.satisfies("+plugin_view"):
+            raise SkipTest("Package must be installed with +plugin_view")
+
+        with open(self.plugin_manifest) as f:
+            manifest = json.load(f)
+        before = self._count_lookup_calls(os.pathsep.join(manifest["search_path"]))
+        after = self._count_lookup_calls(self.prefix.plugins)
+        print(
+            f"plugin lookup: {len(manifest['search_path'])} directories, {before} calls; "
+            f"plugin view: 1 directory, {after} calls"
+        )
+        assert after <= before, "plugin view needs more file-system calls than the search path"
+
+    def test_search_view(self):
+        """check that the merged search trees resolve like the original paths"""
+        if not self.spec.satisfies("+search_view"):
+            raise SkipTest("Package must be installed with +search_view")
+
+        for name, view in _SEARCH_VIEWS.items():
+            with open(self.search_index(name)) as f:
+                index = json.load(f)
+            for relative, source in index["files"].items():
+                resolved = next(
+                    join_path(directory, relative)
+                    for directory in index["search_path"]
+                    if os.path.exists(join_path(directory, relative))
+                )
+                merged = join_path(self.prefix, view, relative)
+                assert os.path.realpath(resolved) == os.path.realpath(merged), (
+                    f"{name}: {relative} resolves to {resolved} but the view has {merged}"
+                )
+            print(f"{name}: {len(index['files'])} files match {len(index['search_path'])} entries")
+
+    def test_activation_script(self):
+        """compare sourcing the activation script with spack load"""
+        sh = which("sh", required=True)
+        script = self.activation_script("sh")
+
+        def environment(command):
+            start = time.perf_counter()
+            output = sh("-c", f"{command} && env -0", output=str)
+            elapsed = time.perf_counter() - start
+            return dict(line.split("=", 1) for line in output.split("\0") if "=" in line), elapsed
+
+        sourced, sourced_time = environment(f". {script}")
+        print(f"sourcing {script}: {sourced_time:.3f} s")
+
+        spack = which("spack")
+        if not spack:
+            raise SkipTest("spack not on PATH; comparison with spack load skipped")
+        loaded, loaded_time = environment(f'eval "$({spack.path} load --sh /{self.spec.dag_hash()})"')
+        print(f"spack load {self.spec.short_spec}: {loaded_time:.3f} s")
+
+        differing = sorted(
+            name
+            for name in set(sourced) | set(loaded)
+            if not name.startswith("SPACK_") and sourced.get(name) != loaded.get(name)
+        )
+        assert not differing, f"activation script and spack load differ in: {', '.join(differing)}"
+
+    def test_grid_closure(self):
+        """list the packages and shared libraries in the +grid closure"""
+        if not self.spec.satisfies("+grid"):
+            raise SkipTest("Package must be installed with +grid")
+
+        closure = sorted(self.spec.traverse(root=False, deptype=("link", "run")), key=str)
+        names = {dependency.name for dependency in closure}
+        included = sorted(names.intersection(_GRID_EXCLUDED))
+        assert not included, f"+grid closure contains {', '.join(included)}"
+        assert self.spec["root"].satisfies("~x~opengl"), "+grid closure has ROOT graphics"
+
+        libraries = 0
+        for dependency in closure:
+            count = sum(
+                len(glob.glob(join_path(dependency.prefix, lib, "*.so*")))
+                for lib in ("lib", "lib64")
+            )
+            libraries += count
+            print(f"{dependency.name}@{dependency.version}: {count} shared libraries")
+        print(f"+grid closure: {len(closure)} packages, {libraries} shared libraries")
+
+    def _allocation_stress(self, extra_env):
+        """Run the allocation stress script; return wall time and peak RSS in MiB."""
+        script = join_path(self.test_suite.stage, "allocation_stress.py")
+        with open(script, "w") as f:
+            f.write(_ALLOCATION_STRESS)
+        env = {name: value for name, value in os.environ.items() if name != "LD_PRELOAD"}
+        env.update(extra_env, PYTHONMALLOC="malloc")
+        elapsed, rss = self.measured_run([sys.executable, script], env=env)
+        return elapsed, rss / 2**20
+
+    def test_allocator(self):
+        """compare wall time and peak RSS of the system and configured allocators"""
+        results = {"system": self._allocation_stress({})}
+        allocator = self.spec.variants["allocator"].value
+        if allocator != "system":
+            results[allocator] = self._allocation_stress(
+                {"LD_PRELOAD": self.allocator_library(), **_ALLOCATORS[allocator][2]}
+            )
+        for name, (elapsed, rss) in results.items():
+            print(f"{name}: {elapsed:.2f} s, peak RSS {rss:.0f} MiB")
+
+    def test_inference_threads(self):
+        """compare CNN inference throughput under different thread settings"""
+        if "py-torch" not in self.spec:
+            raise SkipTest("Package must be installed with torch")
+        python = self.spec["python"].command
+
+        settings = []
+        threads = 1
+        while threads <= os.cpu_count():
+            settings.append(threads)
+            threads *= 2
+        configured = self.spec.variants["threads"].value
+        if configured != "none" and int(configured) not in settings:
+            settings.append(int(configured))
+
+        for threads in sorted(settings):
+            throughput = float(
+                python(
+                    "-c", _INFERENCE_WORKLOAD, output=str, extra_env=_thread_settings(threads)
+                )
+            )
+            marker = " (configured)" if str(threads) == configured else ""
+            print(f"{threads:3d} thread(s): {throughput:8.1f} patches/s{marker}")
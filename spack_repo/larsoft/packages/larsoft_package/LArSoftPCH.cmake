@@ -0,0 +1,51 @@
+# Precompile the art, canvas, fhicl-cpp, messagefacility and ROOT headers
+# that nearly every LArSoft translation unit includes, once per project,
+# and reuse the result in every library that links against art.
+# Included by the LArSoft recipes' patch() when built with +pch.
+
+set(_larsoft_pch_headers
+  <memory>
+  <string>
+  <vector>
+  <art/Framework/Core/EDProducer.h>
+  <art/Framework/Principal/Event.h>
+  <art/Framework/Services/Registry/ServiceHandle.h>
+  <canvas/Persistency/Common/Ptr.h>
+  <fhiclcpp/ParameterSet.h>
+  <messagefacility/MessageLogger/MessageLogger.h>)
+if(TARGET ROOT::Hist AND TARGET ROOT::Tree)
+  list(APPEND _larsoft_pch_headers <TH1.h> <TTree.h>)
+endif()
+
+file(WRITE ${CMAKE_CURRENT_BINARY_DIR}/larsoft_pch.cc "")
+add_library(larsoft_pch OBJECT ${CMAKE_CURRENT_BINARY_DIR}/larsoft_pch.cc)
+set_target_properties(larsoft_pch PROPERTIES POSITION_INDEPENDENT_CODE ON)
+target_link_libraries(larsoft_pch PRIVATE
+  art::Framework_Core
+  art::Framework_Principal
+  art::Framework_Services_Registry
+  canvas::canvas
+  fhiclcpp::fhiclcpp
+  messagefacility::MF_MessageLogger
+  $<TARGET_NAME_IF_EXISTS:ROOT::Hist>
+  $<TARGET_NAME_IF_EXISTS:ROOT::Tree>)
+target_precompile_headers(larsoft_pch PRIVATE ${_larsoft_pch_headers})
+
+function(_larsoft_reuse_pch directory)
+  get_property(_targets DIRECTORY ${directory} PROPERTY BUILDSYSTEM_TARGETS)
+  foreach(_target IN LISTS _targets)
+    get_target_property(_type ${_target} TYPE)
+    if(_type MATCHES "^(SHARED|MODULE)_LIBRARY$")
+      get_target_property(_libraries ${_target} LINK_LIBRARIES)
+      if(_libraries MATCHES "art(_plugin_types)?::")
+        target_precompile_headers(${_target} REUSE_FROM larsoft_pch)
+      endif()
+    endif()
+  endforeach()
+  get_property(_subdirectories DIRECTORY ${directory} PROPERTY SUBDIRECTORIES)
+  foreach(_subdirectory IN LISTS _subdirectories)
+    _larsoft_reuse_pch(${_subdirectory})
+  endforeach()
+endfunction()
+
+_larsoft_reuse_pch(${CMAKE_CURRENT_SOURCE_DIR})
@@ -0,0 +1,391 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from spack.package import *
+
+# TensorFlow package directories found by LarsoftPackage.tensorflow_dir, by DAG hash.
+_TENSORFLOW_DIRS = {}
+
+# Entry points that cetlib's plugin factories look up in each kind of art plugin.
+_PLUGIN_SYMBOLS = {
+    "module": ("pluginType", "make_module", "moduleType"),
+    "service": ("pluginType", "create_service_helper"),
+    "tool": ("pluginType", "makeTool", "toolType"),
+    "source": ("pluginType", "make"),
+    "plugin": ("pluginType", "makePlugin"),
+}
+
+_PLUGIN_SYMBOLS_CHECK = """
+import ctypes, os, sys
+
+library = ctypes.CDLL(sys.argv[1], mode=os.RTLD_NOW | os.RTLD_LOCAL)
+missing = [symbol for symbol in sys.argv[2:] if not hasattr(library, symbol)]
+if missing:
+    sys.exit(f"{sys.argv[1]} does not export {', '.join(missing)}")
+"""
+
+_PLUGIN_LOAD = """
+import ctypes, json, os, sys, time
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+before = rss()
+start = time.perf_counter()
+ctypes.CDLL(sys.argv[1], mode=os.RTLD_NOW | os.RTLD_LOCAL)
+print(json.dumps({"seconds": time.perf_counter() - start, "rss_bytes": rss() - before}))
+"""
+
+
+def unity_build_variant(batch_size="8"):
+    """Declare the unity and unity_batch_size variants used by larsoft_cmake_args."""
+    variant("unity", default=False, description="Build with CMAKE_UNITY_BUILD")
+    variant(
+        "unity_batch_size",
+        default=batch_size,
+        values=lambda value: value.isdigit() and int(value) > 0,
+        when="+unity",
+        description="Number of sources combined into each unity translation unit",
+    )
+
+
+def precompiled_headers_variant():
+    """Declare the pch variant applied by LarsoftPackage.patch_precompiled_headers."""
+    variant(
+        "pch",
+        default=False,
+        description="Precompile the common art, canvas, fhicl-cpp, messagefacility and ROOT headers",
+    )
+
+
+class LarsoftPackage(PackageBase):
+    """Build options and checks shared by the LArSoft CMake recipes.
+
+    Not installable on its own: list it as a base class next to
+    CMakePackage and add ``self.larsoft_cmake_args()`` to ``cmake_args``.
+    A recipe that needs flags of its own overrides ``flag_handler`` and
+    ends it with ``return super().flag_handler(name, flags)``.
+    """
+
+    variant(
+        "prof",
+        default=False,
+        description="Keep frame pointers and debug line info for profiling (UPS 'prof' qualifier)",
+    )
+    conflicts("build_type=Debug", when="+prof", msg="+prof is an optimized build profile")
+
+    variant(
+        "ccache",
+        default=False,
+        description="Compile through ccache, with a cache shared by all LArSoft builds",
+    )
+    depends_on("ccache", type="build", when="+ccache")
+
+    variant(
+        "linker",
+        default="bfd",
+        values=("bfd", "gold", "lld", "mold"),
+        multi=False,
+        description="Linker used for LArSoft libraries, plugins and executables",
+    )
+    depends_on("binutils+gold", type="build", when="linker=gold")
+    depends_on("llvm+lld", type="build", when="linker=lld")
+    depends_on("mold", type="build", when="linker=mold")
+    conflicts("linker=mold", when="%gcc@:12.0", msg="-fuse-ld=mold needs GCC 12.1 or later")
+
+    variant(
+        "as_needed",
+        default=False,
+        description="Link with -Wl,--as-needed so plugins record only the libraries they use",
+    )
+
+    variant(
+        "visibility",
+        default=False,
+        description="Compile with -fvisibility-inlines-hidden -fno-semantic-interposition",
+    )
+    variant(
+        "bsymbolic_functions",
+        default=False,
+        when="+visibility",
+        description="Also bind function references within each library with -Bsymbolic-functions",
+    )
+
+    @property
+    def ccache_stats_log(self):
+        return join_path(self.prefix, ".spack", "ccache-stats.log")
+
+    @property
+    def plugin_load_report(self):
+        return join_path(self.prefix, ".spack", "plugin-load.json")
+
+    def ccache_launcher(self):
+        """Compiler launcher having Spack's compiler wrapper run ccache.
+
+        ccache then sees the final command line, so the target and
+        ``flag_handler`` flags added by the wrapper are part of the hash. The
+        cache lives in $LARSOFT_CCACHE_DIR (default ~/.cache/larsoft-ccache).
+        Paths below the directory holding both the stage and the install tree
+        are hashed relative to the working directory, so a rebuild in a
+        differently-hashed stage or prefix still hits.
+        """
+        cache_dir = os.environ.get(
+            "LARSOFT_CCACHE_DIR", join_path(os.path.expanduser("~"), ".cache", "larsoft-ccache")
+        )
+        stage_root = os.path.dirname(self.stage.path)
+        base_dir = os.path.commonpath([stage_root, self.prefix])
+        return [
+            "env",
+            f"CCACHE_DIR={cache_dir}",
+            # ccache rewrites system header paths too when the base is /.
+            f"CCACHE_BASEDIR={stage_root if base_dir == os.sep else base_dir}",
+            "CCACHE_NOHASHDIR=true",
+            f"CCACHE_STATSLOG={self.ccache_stats_log}",
+            f"SPACK_CCACHE_BINARY={self.spec['ccache'].prefix.bin.ccache}",
+        ]
+
+    @staticmethod
+    def ccache_hits(stats_log):
+        """Numbers of cache hits and misses recorded in a ccache statistics log."""
+        hits = misses = 0
+        with open(stats_log) as f:
+            for line in f:
+                result = line.strip()
+                if result.endswith("cache_hit"):
+                    hits += 1
+                elif result == "cache_miss":
+                    misses += 1
+        return hits, misses
+
+    @staticmethod
+    def measured_run(argv, **kwargs):
+        """Run a command to completion; return its wall time and peak RSS in bytes.
+
+        Keyword arguments are passed to subprocess.Popen.
+        """
+        start = time.perf_counter()
+        process = subprocess.Popen(argv, **kwargs)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        assert process.returncode == 0, f"{' '.join(argv)} exited with {process.returncode}"
+        return elapsed, usage.ru_maxrss * 1024
+
+    def larsoft_cmake_args(self):
+        args = []
+        if self.spec.satisfies("+unity"):
+            args.append(self.define("CMAKE_UNITY_BUILD", True))
+            args.append(
+                self.define_from_variant("CMAKE_UNITY_BUILD_BATCH_SIZE", "unity_batch_size")
+            )
+        linker = self.spec.variants["linker"].value
+        if linker != "bfd":
+            for kind in ("EXE", "SHARED", "MODULE"):
+                args.append(self.define(f"CMAKE_{kind}_LINKER_FLAGS_INIT", f"-fuse-ld={linker}"))
+        if self.spec.satisfies("+ccache"):
+            args.append(self.define("CMAKE_C_COMPILER_LAUNCHER", self.ccache_launcher()))
+            args.append(self.define("CMAKE_CXX_COMPILER_LAUNCHER", self.ccache_launcher()))
+        return args
+
+    def larsoft_flags(self, name):
+        """Compiler flags requested by the LArSoft build options."""
+        flags = []
+        if name in ("cflags", "cxxflags") and self.spec.satisfies("+prof"):
+            flags.append("-fno-omit-frame-pointer")
+            flags.append("-gline-tables-only" if self.spec.compiler.name == "clang" else "-g1")
+        if name == "cxxflags" and self.spec.satisfies("+visibility"):
+            flags.append("-fvisibility-inlines-hidden")
+        if name in ("cflags", "cxxflags") and self.spec.satisfies("+visibility"):
+            flags.append("-fno-semantic-interposition")
+        if name == "ldflags" and self.spec.satisfies("+as_needed"):
+            flags.append("-Wl,--as-needed")
+        if name == "ldflags" and self.spec.satisfies("+bsymbolic_functions"):
+            flags.append("-Wl,-Bsymbolic-functions")
+        return flags
+
+    def flag_handler(self, name, flags):
+        flags.extend(self.larsoft_flags(name))
+        return (flags, None, None)
+
+    def _plugin_libraries(self, kinds=("module", "service", "tool", "source", "plugin")):
+        """Installed art plugin libraries of the given kinds."""
+        return sorted(
+            library
+            for kind in kinds
+            for library in glob.glob(join_path(self.prefix.lib, f"*_{kind}.so"))
+        )
+
+    def tensorflow_dir(self):
+        """Directory of the tensorflow Python package in the py-tensorflow dependency.
+
+        Depending on the platform it is installed below lib or lib64; the
+        directory that exists is found once and remembered.
+        """
+        tensorflow = self.spec["py-tensorflow"]
+        if tensorflow.dag_hash() not in _TENSORFLOW_DIRS:
+            site_packages = join_path(
+                f"python{self.spec['python'].version.up_to(2)}", "site-packages", "tensorflow"
+            )
+            candidates = [
+                join_path(lib, site_packages)
+                for lib in (tensorflow.prefix.lib, tensorflow.prefix.lib64)
+            ]
+            found = next((path for path in candidates if os.path.isdir(path)), None)
+            if found is None:
+                raise InstallError(
+                    f"py-tensorflow has no tensorflow package in {' or '.join(candidates)}"
+                )
+            _TENSORFLOW_DIRS[tensorflow.dag_hash()] = found
+        return _TENSORFLOW_DIRS[tensorflow.dag_hash()]
+
+    def setup_tensorflow_environment(self, env):
+        env.set("TENSORFLOW_DIR", self.tensorflow_dir())
+        env.set("TENSORFLOW_INC", join_path(self.tensorflow_dir(), "include"))
+
+    def write_tensorflow_hints(self):
+        """Record the TensorFlow location in share/<package>/tensorflow-hints.cmake."""
+        hints = join_path(self.prefix.share, self.name)
+        mkdirp(hints)
+        with open(join_path(hints, "tensorflow-hints.cmake"), "w") as f:
+            f.write(f'set(TENSORFLOW_DIR "{self.tensorflow_dir()}")\n')
+            f.write(f'set(TENSORFLOW_INC "{join_path(self.tensorflow_dir(), "include")}")\n')
+
+    def strip_cmake_components(self, components):
+        """Drop the components whose variant is off from the CMake build.
+
+        ``components`` maps each variant to the CMake packages it looks up in
+        the top-level CMakeLists.txt and the source directories it adds. Not
+        every release has every component, so absent lines are ignored.
+        """
+        cmake_lists = find(self.name, "CMakeLists.txt")
+        for name, (packages, directories) in components.items():
+            if self.spec.satisfies(f"+{name}"):
+                continue
+            filter_file(
+                r"(?i)^\s*find_package\(\s*(%s)\b.*$" % "|".join(packages),
+                "",
+                "CMakeLists.txt",
+                ignore_absent=True,
+            )
+            filter_file(
+                r"^\s*add_subdirectory\(\s*(%s)\s*\).*$" % "|".join(directories),
+                "",
+                *cmake_lists,
+                ignore_absent=True,
+            )
+
+    def patch_precompiled_headers(self):
+        """Have the top-level CMakeLists.txt reuse one precompiled header in art libraries."""
+        copy(join_path(os.path.dirname(__file__), "LArSoftPCH.cmake"), "LArSoftPCH.cmake")
+        filter_file(
+            r"^(\s*cet_cmake_config\()",
+            "include(${CMAKE_CURRENT_SOURCE_DIR}/LArSoftPCH.cmake)\n\\1",
+            "CMakeLists.txt",
+        )
+
+    def test_cmake_options(self):
+        """check that the LArSoft build options reached the CMake cache"""
+        caches = glob.glob(
+            join_path(self.prefix, ".spack", "archived-files", "**", "CMakeCache.txt"),
+            recursive=True,
+        )
+        if not caches:
+            raise SkipTest("No archived CMakeCache.txt in the install prefix")
+
+        cache = {}
+        with open(caches[0]) as f:
+            for line in f:
+                match = re.match(r"^([^#/][^:=]*):[A-Z]+=(.*)$", line.rstrip("\n"))
+                if match:
+                    cache[match.group(1)] = match.group(2)
+
+        # CMakeBuilder passes CMAKE_INTERPROCEDURAL_OPTIMIZATION from the ipo variant.
+        expected = [self.define_from_variant("CMAKE_INTERPROCEDURAL_OPTIMIZATION", "ipo")]
+        for arg in expected + self.larsoft_cmake_args():
+            name, value = re.match(r"^-D([^:=]+)(?::[A-Z]+)?=(.*)$", arg).groups()
+            if name.endswith("_COMPILER_LAUNCHER"):
+                # Only the ccache executable is fixed; the other settings depend
+                # on the environment the package was built in.
+                value, cached = value.split(";")[-1], cache.get(name, "").split(";")[-1]
+            else:
+                cached = cache.get(name)
+            assert cached == value, f"{name}={cached} in CMakeCache.txt, expected {value}"
+            print(f"{name}={value}")
+
+    def test_plugin_dependencies(self):
+        """report the DT_NEEDED entries of each plugin and the libraries it loads"""
+        plugins = self._plugin_libraries()
+        if not plugins:
+            raise SkipTest("No art plugins installed")
+        readelf = which("readelf", required=True)
+        ldd = which("ldd", required=True)
+
+        loaded = set()
+        for plugin in plugins:
+            needed = readelf("-d", plugin, output=str).count("(NEEDED)")
+            closure = {
+                line.split()[0] for line in ldd(plugin, output=str).splitlines() if "=>" in line
+            }
+            loaded |= closure
+            print(f"{os.path.basename(plugin)}: {needed} DT_NEEDED, {len(closure)} loaded")
+        print(f"{len(plugins)} plugins load {len(loaded)} distinct shared libraries")
+
+    def test_plugin_symbols(self):
+        """check that each art plugin loads and still exports its factory entry points"""
+        plugins = self._plugin_libraries()
+        if not plugins:
+            raise SkipTest("No art plugins installed")
+        python = Executable(sys.executable)
+        for plugin in plugins:
+            kind = re.search(r"_([a-z]+)\.so$", plugin).group(1)
+            symbols = _PLUGIN_SYMBOLS[kind]
+            # A fresh interpreter per plugin, so a failure names the library.
+            python("-c", _PLUGIN_SYMBOLS_CHECK, plugin, *symbols)
+            print(f"{os.path.basename(plugin)}: {', '.join(symbols)} exported")
+
+    def test_plugin_load(self):
+        """time loading each module, service and tool and record the results"""
+        plugins = self._plugin_libraries(("module", "service", "tool"))
+        if not plugins:
+            raise SkipTest("No art modules, services or tools installed")
+        python = Executable(sys.executable)
+
+        report = {}
+        for plugin in plugins:
+            # Each plugin is loaded into a fresh interpreter so that libraries
+            # already mapped by earlier plugins do not hide its cost.
+            report[os.path.basename(plugin)] = json.loads(
+                python("-c", _PLUGIN_LOAD, plugin, output=str)
+            )
+        with open(self.plugin_load_report, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+        for library, result in sorted(report.items(), key=lambda item: -item[1]["seconds"]):
+            print(
+                f"{1000 * result['seconds']:8.1f} ms {result['rss_bytes'] / 2**20:8.1f} MiB  {library}"
+            )
+        total = sum(result["seconds"] for result in report.values())
+        print(f"Loaded {len(report)} plugins in {total:.2f} s; report in {self.plugin_load_report}")
+
+    def test_ccache_hit_rate(self):
+        """report the ccache hit rate of the build that produced this installation"""
+        if not self.spec.satisfies("+ccache"):
+            raise SkipTest("Package must be installed with +ccache")
+        if not os.path.exists(self.ccache_stats_log):
+            raise SkipTest("No ccache statistics were recorded for this build")
+
+        hits, misses = self.ccache_hits(self.ccache_stats_log)
+        compilations = hits + misses
+        assert compilations, "ccache recorded no cacheable compilations"
+        print(f"ccache: {hits} hits, {misses} misses ({100 * hits / compilations:.1f}% hit rate)")
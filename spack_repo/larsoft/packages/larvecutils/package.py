@@ -3,13 +3,91 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import os
+
 from spack import *
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
+
+# Fits a batch of synthetic three-Gaussian pulses one after the other with
+# MarqFitAlg and reports the throughput; any parallelism is the library's own.
+_MARQFIT_BENCHMARK = r"""
+#include "larvecutils/MarqFitAlg/MarqFitAlg.h"
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+
+int main(int argc, char** argv)
+{
+  int const nPulses = argc > 1 ? std::atoi(argv[1]) : 20000;
+  int const nGaus = 3;
+  int const nParam = 3 * nGaus;
+  int const nData = 60;
+
+  std::vector<float> data(nPulses * nData), truth(nPulses * nParam);
+  std::mt19937 rng(12345);
+  std::uniform_real_distribution<float> height(20.f, 100.f), width(2.f, 4.f), shift(-1.f, 1.f);
+  std::normal_distribution<float> noise(0.f, 1.f);
+  for (int i = 0; i < nPulses; ++i) {
+    float* p = &truth[i * nParam];
+    float* y = &data[i * nData];
+    for (int g = 0; g < nGaus; ++g) {
+      p[3 * g] = height(rng);
+      p[3 * g + 1] = 15.f + 15.f * g + shift(rng);
+      p[3 * g + 2] = width(rng);
+    }
+    for (int x = 0; x < nData; ++x) {
+      y[x] = noise(rng);
+      for (int g = 0; g < nGaus; ++g) {
+        float const z = (x - p[3 * g + 1]) / p[3 * g + 2];
+        y[x] += p[3 * g] * std::exp(-0.5f * z * z);
+      }
+    }
+  }
+
+  int failed = 0;
+  auto const start = std::chrono::steady_clock::now();
+  for (int i = 0; i < nPulses; ++i) {
+    gshf::MarqFitAlg fitter;
+    float p[nParam], plo[nParam], phi[nParam];
+    for (int g = 0; g < nGaus; ++g) {
+      float const* t = &truth[i * nParam + 3 * g];
+      p[3 * g] = 1.1f * t[0];
+      p[3 * g + 1] = t[1] + 0.5f;
+      p[3 * g + 2] = 0.9f * t[2];
+      plo[3 * g] = 0.f;
+      phi[3 * g] = 1000.f;
+      plo[3 * g + 1] = 0.f;
+      phi[3 * g + 1] = nData;
+      plo[3 * g + 2] = 0.5f;
+      phi[3 * g + 2] = 20.f;
+    }
+    float lambda = 0.001f, chiSqr = 0.f, dchiSqr = 0.f;
+    for (int trial = 0; trial < 100; ++trial) {
+      if (fitter.mrqdtfit(lambda, p, plo, phi, &data[i * nData], nParam, nData, chiSqr, dchiSqr)) {
+        ++failed;
+        break;
+      }
+      if (std::abs(dchiSqr) < 1e-4f) break;
+    }
+  }
+  double const seconds =
+    std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+
+  std::printf("%.0f\n", nPulses / seconds);
+  if (failed) std::fprintf(stderr, "%d of %d fits failed\n", failed, nPulses);
+  return 0;
+}
+"""
 
 
-class Larvecutils(CMakePackage, FnalGithubPackage):
+class Larvecutils(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larvecutils"""
 
     repo = "LArSoft/larvecutils"
@@ -24,22 +102,73 @@ class Larvecutils(CMakePackage, FnalGithubPackage):
 
     cxxstd_variant("17", "20", default="17")
 
+    variant("openmp", default=True, description="Parallelize MarqFitAlg with OpenMP")
+
     depends_on("c", type="build")
     depends_on("cxx", type="build")
 
     depends_on("cetmodules", type="build")
 
+    # GCC ships libgomp; clang needs an OpenMP runtime of its own.
+    depends_on("llvm-openmp", when="+openmp %clang")
+    depends_on("llvm-openmp", when="+openmp %apple-clang")
+
+    test_requires_compiler = True
+
     def patch(self):
-        filter_file("find_package\(OpenMP EXPORT\)",
-                    "find_package(OpenMP)",
-                    "larvecutils/MarqFitAlg/CMakeLists.txt")
-        filter_file("PUBLIC OpenMP::",
-                    "PRIVATE OpenMP::",
-                    "larvecutils/MarqFitAlg/CMakeLists.txt")
+        if self.spec.satisfies("+openmp"):
+            filter_file("find_package\(OpenMP EXPORT\)",
+                        "find_package(OpenMP REQUIRED)",
+                        "larvecutils/MarqFitAlg/CMakeLists.txt")
+            filter_file("PUBLIC OpenMP::",
+                        "PRIVATE OpenMP::",
+                        "larvecutils/MarqFitAlg/CMakeLists.txt")
+        else:
+            filter_file("find_package\(OpenMP EXPORT\)",
+                        "",
+                        "larvecutils/MarqFitAlg/CMakeLists.txt")
+            filter_file(r"(PUBLIC|PRIVATE)\s+OpenMP::\w+",
+                        "",
+                        "larvecutils/MarqFitAlg/CMakeLists.txt")
 
 
     def cmake_args(self):
         return [
             self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
             self.define("IGNORE_ABSOLUTE_TRANSITIVE_DEPENDENCIES", True),
+            self.define("CMAKE_DISABLE_FIND_PACKAGE_OpenMP", self.spec.satisfies("~openmp")),
+            *self.larsoft_cmake_args(),
         ]
+
+    def test_marqfit_throughput(self):
+        """check MarqFitAlg's OpenMP linkage and fit throughput against OMP_NUM_THREADS"""
+        library = find_libraries("liblarvecutils_MarqFitAlg", root=self.prefix, recursive=True)[0]
+        needed = which("readelf", required=True)("-d", library, output=str)
+        linked = any(runtime in needed for runtime in ("libgomp", "libomp", "libiomp5"))
+        if self.spec.satisfies("+openmp"):
+            assert linked, f"{library} is not linked against an OpenMP runtime"
+        else:
+            assert not linked, f"{library} is linked against an OpenMP runtime with ~openmp"
+
+        with open("marqfit_benchmark.cc", "w") as f:
+            f.write(_MARQFIT_BENCHMARK)
+        cxx = which(os.environ.get("CXX", "c++"), required=True)
+        cxx(
+            f"-std=c++{self.spec.variants['cxxstd'].value}",
+            "-O2",
+            f"-I{self.prefix.include}",
+            "marqfit_benchmark.cc",
+            f"-L{self.prefix.lib}",
+            f"-Wl,-rpath,{self.prefix.lib}",
+            "-llarvecutils_MarqFitAlg",
+            "-o",
+            "marqfit_benchmark",
+        )
+        benchmark = Executable("./marqfit_benchmark")
+
+        max_threads = os.cpu_count() if self.spec.satisfies("+openmp") else 1
+        threads = 1
+        while threads <= max_threads:
+            rate = float(benchmark(output=str, extra_env={"OMP_NUM_THREADS": str(threads)}))
+            print(f"{threads:3d} thread(s): {rate:10.0f} fits/s")
+            threads *= 2
@@ -3,13 +3,31 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import array
+import io
+import json
+import os
+import random
+import tarfile
+import time
+
 from spack import *
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 from spack_repo.fnal_art.packages.fnal_github_package.package import *
+from spack_repo.larsoft.packages.larsoft_package.package import *
+
+# h5repack filter settings compared by test_hdf5_compression. 32001 is the
+# registered Blosc filter; its cd_values end in level, shuffle and codec.
+_HDF5_FILTERS = {
+    "none": [],
+    "gzip": ["-f", "GZIP=4"],
+    "blosc-lz4": ["-f", "UD=32001,0,7,0,0,0,0,5,1,1"],
+    "blosc-zstd": ["-f", "UD=32001,0,7,0,0,0,0,5,1,5"],
+}
 
 
-class Larwirecell(CMakePackage, FnalGithubPackage):
+class Larwirecell(CMakePackage, FnalGithubPackage, LarsoftPackage):
     """Larwirecell"""
 
     repo = "LArSoft/larwirecell"
@@ -45,6 +63,14 @@ class Larwirecell(CMakePackage, FnalGithubPackage):
     version("develop", branch="develop", get_full_repo=True)
 
     cxxstd_variant("17", "20", default="17")
+    unity_build_variant()
+
+    variant("tbb", default=True, description="Use a wire-cell-toolkit with the TbbFlow graph engine")
+    variant(
+        "compression",
+        default=False,
+        description="Provide the Blosc (LZ4, Zstd) HDF5 filter plugin for frame output",
+    )
 
     patch('v10.00.02.patch', when="@10.00.02")
 
@@ -64,6 +90,7 @@ class Larwirecell(CMakePackage, FnalGithubPackage):
     depends_on("root")
     depends_on("wire-cell-toolkit+cppjsonnet", when="@:10.03.06")
     depends_on("wire-cell-toolkit@0.37.0:", when="@10.03.07:")
+    depends_on("wire-cell-toolkit+tbb", when="+tbb")
 
     # Dependencies for FindWireCell.cmake module
     depends_on("boost")
@@ -73,6 +100,7 @@ class Larwirecell(CMakePackage, FnalGithubPackage):
     depends_on("spdlog")
     depends_on("tbb")
     depends_on("hdf5")
+    depends_on("hdf5-blosc", when="+compression")
 
     def patch(self):
         filter_file(r"list\(TRANSFORM _fwc_deps APPEND _FOUND", "", "Modules/FindWireCell.cmake")
@@ -108,10 +136,163 @@ class Larwirecell(CMakePackage, FnalGithubPackage):
         return [
             self.define_from_variant("CMAKE_CXX_STANDARD", "cxxstd"),
             self.define("IGNORE_ABSOLUTE_TRANSITIVE_DEPENDENCIES", True),
-            self.define("jsoncpp_DIR", self.spec["jsoncpp"].prefix)
+            self.define("jsoncpp_DIR", self.spec["jsoncpp"].prefix),
+            *self.larsoft_cmake_args(),
         ]
 
     @sanitize_paths
     def setup_run_environment(self, env):
         env.prepend_path("CET_PLUGIN_PATH", self.prefix.lib)
         env.prepend_path("FHICL_FILE_PATH", self.prefix.fcl)
+        if self.spec.satisfies("+tbb"):
+            # Wire-Cell loads its component plugins (WireCellTbb, ...) by library name.
+            env.prepend_path("LD_LIBRARY_PATH", self.wire_cell_plugin_dir())
+            env.prepend_path("WIRECELL_PATH", self.spec["wire-cell-toolkit"].prefix.share.wirecell)
+        if self.spec.satisfies("+compression"):
+            env.prepend_path("HDF5_PLUGIN_PATH", self.hdf5_plugin_dir())
+
+    def wire_cell_plugin_dir(self):
+        toolkit = self.spec["wire-cell-toolkit"].prefix
+        return find_libraries("libWireCellTbb", root=toolkit, recursive=True).directories[0]
+
+    def hdf5_plugin_dir(self):
+        blosc = self.spec["hdf5-blosc"].prefix
+        return find_libraries("libH5Zblosc", root=blosc, recursive=True).directories[0]
+
+    @staticmethod
+    def _write_noise_frames(path, frames, channels, ticks):
+        """Write synthetic noise frames in the tar layout read by Wire-Cell's FrameFileSource."""
+
+        def npy(descr, shape, data):
+            header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': {shape}, }}"
+            header += " " * (63 - (len(header) + 10) % 64) + "\n"
+            return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode() + data
+
+        rng = random.Random(12345)
+        waveforms = [array.array("f", (rng.gauss(0, 3) for _ in range(ticks))) for _ in range(64)]
+        with tarfile.open(path, "w") as tar:
+            for ident in range(frames):
+                samples = array.array("f")
+                for channel in range(channels):
+                    samples.extend(waveforms[(channel * 7 + ident) % len(waveforms)])
+                members = {
+                    "frame": npy("<f4", (channels, ticks), samples.tobytes()),
+                    "channels": npy("<i4", (channels,), array.array("i", range(channels)).tobytes()),
+                    # Frame time, tick (500 ns in Wire-Cell units) and first tick.
+                    "tickinfo": npy("<f8", (3,), array.array("d", [0, 500, 0]).tobytes()),
+                }
+                for name, data in members.items():
+                    info = tarfile.TarInfo(f"{name}_orig_{ident}.npy")
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+
+    def test_tbb_flow(self):
+        """compare a synthetic noise-frame resampling graph under TbbFlow on 1 and N threads"""
+        if not self.spec.satisfies("+tbb"):
+            raise SkipTest("Package must be installed with +tbb")
+
+        # Every frame is resampled from 500 ns to 512 ns ticks by eight
+        # FFT-based Resampler branches, which TbbFlow can run concurrently.
+        branches = 8
+        self._write_noise_frames("frames.tar", frames=10, channels=960, ticks=6000)
+        config = [
+            {"type": "FftwDFT", "name": "", "data": {}},
+            {"type": "FrameFileSource", "name": "", "data": {"inname": "frames.tar", "tags": ["orig"]}},
+            {"type": "FrameFanout", "name": "", "data": {"multiplicity": branches}},
+        ]
+        edges = [{"tail": {"node": "FrameFileSource"}, "head": {"node": "FrameFanout"}}]
+        for port in range(branches):
+            config.append(
+                {
+                    "type": "Resampler",
+                    "name": f"resample{port}",
+                    "data": {"period": 512, "time_pad": "linear", "dft": "FftwDFT"},
+                }
+            )
+            config.append({"type": "DumpFrames", "name": f"sink{port}", "data": {}})
+            edges.append(
+                {
+                    "tail": {"node": "FrameFanout", "port": port},
+                    "head": {"node": f"Resampler:resample{port}"},
+                }
+            )
+            edges.append(
+                {
+                    "tail": {"node": f"Resampler:resample{port}"},
+                    "head": {"node": f"DumpFrames:sink{port}"},
+                }
+            )
+        config.append({"type": "TbbFlow", "name": "", "data": {"edges": edges}})
+        with open("tbb_flow.json", "w") as f:
+            json.dump(config, f)
+
+        wire_cell = which("wire-cell", path=self.spec["wire-cell-toolkit"].prefix.bin, required=True)
+
+        def run(threads):
+            start = time.perf_counter()
+            wire_cell(
+                *("-p", "WireCellAux", "-p", "WireCellSio", "-p", "WireCellGen"),
+                *("-p", "WireCellPgraph", "-p", "WireCellTbb"),
+                *("-a", "TbbFlow", "-t", str(threads), "-c", "tbb_flow.json"),
+                output=str,
+                error=str,
+            )
+            return time.perf_counter() - start
+
+        serial = run(1)
+        print(f"TbbFlow, 1 thread: {serial:.2f} s")
+        threads = os.cpu_count()
+        parallel = run(threads)
+        print(f"TbbFlow, {threads} threads: {parallel:.2f} s ({serial / parallel:.2f}x)")
+
+    def test_hdf5_compression(self):
+        """compare write and read throughput of synthetic frames with HDF5 compression filters"""
+        if not self.spec.satisfies("+compression"):
+            raise SkipTest("Package must be installed with +compression")
+        hdf5 = self.spec["hdf5"].prefix.bin
+        h5import = which("h5import", path=hdf5, required=True)
+        h5repack = which("h5repack", path=hdf5, required=True)
+        h5dump = which("h5dump", path=hdf5, required=True)
+        plugins = {"HDF5_PLUGIN_PATH": self.hdf5_plugin_dir()}
+
+        # Ten 2560-channel x 6000-tick frames of baseline, noise and sparse pulses.
+        frames, channels, ticks = 10, 2560, 6000
+        rng = random.Random(12345)
+        waveforms = []
+        for _ in range(64):
+            waveform = array.array("h", (900 + round(rng.gauss(0, 3)) for _ in range(ticks)))
+            start = rng.randrange(ticks - 50)
+            for tick in range(50):
+                waveform[start + tick] += round(200 * (1 - abs(tick - 25) / 25))
+            waveforms.append(waveform)
+        with open("frames.bin", "wb") as f:
+            for _ in range(frames * channels):
+                rng.choice(waveforms).tofile(f)
+        with open("frames.cfg", "w") as f:
+            f.write(
+                "PATH frames\nINPUT-CLASS IN\nINPUT-SIZE 16\nRANK 2\n"
+                f"DIMENSION-SIZES {frames * channels} {ticks}\n"
+                "OUTPUT-CLASS IN\nOUTPUT-SIZE 16\nOUTPUT-BYTE-ORDER LE\n"
+                f"CHUNKED-DIMENSION-SIZES 64 {ticks}\n"
+            )
+        h5import("frames.bin", "-c", "frames.cfg", "-o", "frames.h5")
+        raw = os.path.getsize("frames.bin") / 2**20
+
+        for name, filters in _HDF5_FILTERS.items():
+            output = f"frames-{name}.h5"
+            start = time.perf_counter()
+            h5repack(*filters, "-l", f"CHUNK=64x{ticks}", "frames.h5", output, extra_env=plugins)
+            write = time.perf_counter() - start
+            start = time.perf_counter()
+            h5dump(
+                *("-d", "/frames", "-b", "LE", "-o", "readback.bin", output),
+                output=str,
+                extra_env=plugins,
+            )
+            read = time.perf_counter() - start
+            os.remove("readback.bin")
+            size = os.path.getsize(output) / 2**20
+            print(
+                f"{name:10s}: {size:7.1f} MiB (ratio {raw / size:5.2f}), "
+                f"write {raw / write:7.1f} MiB/s, read {raw / read:7.1f} MiB/s"
+            )
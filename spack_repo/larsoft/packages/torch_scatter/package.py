@@ -3,9 +3,32 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import glob
+import os
+
 from spack.package import *
 from spack_repo.builtin.build_systems.cmake import CMakePackage
 
+_SCATTER_BENCHMARK = """
+import sys, time, torch
+
+torch.ops.load_library(sys.argv[1])
+torch.set_num_threads(int(sys.argv[2]))
+for nodes, features in ((10000, 64), (100000, 64), (100000, 128)):
+    edges = 8 * nodes
+    src = torch.rand(edges, features)
+    index = torch.randint(0, nodes, (edges,)).view(-1, 1).expand_as(src).contiguous()
+    for op in ("scatter_sum", "scatter_mean", "scatter_max"):
+        function = getattr(torch.ops.torch_scatter, op)
+        function(src, index, 0, None, nodes)
+        start = time.perf_counter()
+        for _ in range(10):
+            function(src, index, 0, None, nodes)
+        elapsed = (time.perf_counter() - start) / 10
+        print(f"{op:13s} {nodes:7d} x {features:3d}: {1000 * elapsed:8.2f} ms")
+"""
+
+
 class TorchScatter(CMakePackage):
     """PyTorch Extension Library of Optimized Scatter Operations."""
 
@@ -18,6 +41,10 @@ class TorchScatter(CMakePackage):
 
     version("2.1.2", sha256="6f375dbc9cfe03f330aa29ea553e9c7432e9b040d039b041f08bf05df1a8bf37")
 
+    # The CPU kernels are vectorized for the spec's target; use e.g.
+    # target=x86_64_v3 and the compiler wrapper passes the matching -march.
+    variant("openmp", default=True, description="Parallelize the CPU kernels with OpenMP")
+
     depends_on("c", type="build")
     depends_on("cxx", type="build")
 
@@ -26,6 +53,7 @@ class TorchScatter(CMakePackage):
 
     # Undocumented dependencies
     depends_on("py-torch", type=("build", "link", "run"))
+    depends_on("py-torch+openmp", when="+openmp")
 
     # Historical dependencies
     depends_on("py-pytest-runner", type="build", when="@:2.0.7")
@@ -35,6 +63,13 @@ class TorchScatter(CMakePackage):
                 'set(CMAKE_CXX_STANDARD 17)',
                 'CMakeLists.txt')
 
+    def flag_handler(self, name, flags):
+        if name == "cxxflags" and self.spec.satisfies("+openmp"):
+            flags.extend(["-DAT_PARALLEL_OPENMP", "-fopenmp"])
+        if name == "ldflags" and self.spec.satisfies("+openmp"):
+            flags.append("-fopenmp")
+        return (flags, None, None)
+
     def setup_build_environment(self, env):
         if self.spec.satisfies("@2.0.6:"):
             if "+cuda" in self.spec["py-torch"]:
@@ -59,3 +94,25 @@ class TorchScatter(CMakePackage):
                 "{0}/lib/python{1}/site-packages/torch".format(
                 self.spec["py-torch"].prefix, self.spec["python"].version.up_to(2))
                 ]
+
+    def test_scatter_benchmark(self):
+        """time scatter_sum, scatter_mean and scatter_max on 1..N threads"""
+        libraries = glob.glob(join_path(self.prefix, "lib*", "libtorchscatter.so"))
+        if not libraries:
+            raise SkipTest("libtorchscatter.so is not installed")
+        python = self.spec["python"].command
+
+        threads = 1
+        while threads <= os.cpu_count():
+            print(f"{threads} thread(s):")
+            print(
+                python(
+                    "-c",
+                    _SCATTER_BENCHMARK,
+                    libraries[0],
+                    str(threads),
+                    output=str,
+                    extra_env={"OMP_NUM_THREADS": str(threads)},
+                )
+            )
+            threads *= 2